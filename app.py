@@ -1,300 +1,35 @@
 # -*- coding: utf-8 -*-
-# Streamlit YouTube視聴履歴ダッシュボード（単一ファイル・関数化版）
+# Streamlit YouTube視聴履歴ダッシュボード（関数化版）
 # 全体統計 / 動画別の可視化を video_id の有無で切替
+# データ処理と描画ユーティリティは dashboard/core.py にまとめている
 # ------------------------------------------------------------
 
 import streamlit as st
-import pandas as pd
-import matplotlib
-matplotlib.use('Agg')  # サーバー描画用のスレッドセーフな非対話バックエンド
-from matplotlib.figure import Figure
-import matplotlib.colors as mcolors
-import seaborn as sns
-import json
 
-# ---------------------------------------
-# カラーパレット定義（落ち着いた赤・灰色ベース）
-# ---------------------------------------
-COLOR_RED        = '#A63228'
-COLOR_RED_LIGHT  = '#C9736B'
-COLOR_GRAY       = '#6B6B6B'
-COLOR_GRAY_LIGHT = '#B0B0B0'
-
-HEATMAP_CMAP = mcolors.LinearSegmentedColormap.from_list(
-    'gray_red', ['#F5F5F5', '#B0B0B0', '#A63228']
+from dashboard.core import (
+    COLOR_GRAY,
+    VIDEO_SELECTOR_LIMIT,
+    DETAIL_TABLE_LIMIT,
+    weekday_pivot,
+    render_heatmap,
+    render_line,
+    render_bar,
+    render_calendar_heatmap,
+    load_and_process_data,
+    apply_filters,
+    build_aggregates,
+    build_scoreboard,
+    build_video_options,
+    find_peak,
 )
 
-# ---------------------------------------
-# Matplotlib フォント設定
-# ---------------------------------------
-# グラフ内の文字はすべて英語にしているため、デフォルトフォントのままで
-# 文字化けしない。負の符号だけ環境依存を避けるため設定しておく。
-matplotlib.rcParams['axes.unicode_minus'] = False
-
-
-def new_figure(figsize):
-    """pyplot を介さず Figure を生成する。
-
-    pyplot（plt.*）はグローバルな状態を持ちスレッドセーフではないため、
-    Streamlit のスクリプト実行スレッド上で使うとネイティブクラッシュ
-    （Segmentation fault）を起こしうる。オブジェクト指向 API で直接
-    Figure を作れば、スレッド安全かつ図がグローバル登録されないので
-    メモリにも蓄積しない。
-    """
-    fig = Figure(figsize=figsize)
-    ax = fig.subplots()
-    return fig, ax
-
-# ---------------------------------------
-# 共通ピボット＆描画ユーティリティ
-# ---------------------------------------
-def _weekday_pivot(df: pd.DataFrame, date_col: str, value_col: str) -> pd.DataFrame:
-    tmp = df.copy()
-    tmp['date'] = pd.to_datetime(tmp[date_col]).dt.date
-    tmp['day'] = pd.to_datetime(tmp['date']).dt.day
-    tmp['month_year'] = pd.to_datetime(tmp['date']).dt.to_period('M').astype(str)
-    tmp['weekday_num'] = pd.to_datetime(tmp['date']).dt.dayofweek
-    weekday_map = {0:'Mon',1:'Tue',2:'Wed',3:'Thu',4:'Fri',5:'Sat',6:'Sun'}
-    tmp['weekday'] = tmp['weekday_num'].map(weekday_map)
-    pt = pd.pivot_table(
-        tmp, values=value_col, index='weekday',
-        columns=['month_year', 'day'], fill_value=0
-    )
-    return pt.reindex(list(weekday_map.values()))
-
-def render_heatmap(pivot_table, title, cbar_label='Views', figsize=(20, 8)):
-    fig, ax = new_figure(figsize)
-    fig.patch.set_facecolor('#FAFAFA')
-    ax.set_facecolor('#FAFAFA')
-    sns.heatmap(pivot_table, ax=ax, cmap=HEATMAP_CMAP,
-                linewidths=.5, linecolor='#E0E0E0', cbar_kws={'label': cbar_label})
-    ax.set_title(title, color=COLOR_GRAY, fontsize=13)
-    ax.set_xlabel('Year-Month - Day', color=COLOR_GRAY)
-    ax.set_ylabel('Weekday', color=COLOR_GRAY)
-    ax.tick_params(colors=COLOR_GRAY)
-    ax.tick_params(axis='x', labelrotation=90)
-    return fig
-
-def render_line(df, x, y, title, xlabel, ylabel, figsize=(14, 7)):
-    fig, ax = new_figure(figsize)
-    fig.patch.set_facecolor('white')
-    ax.set_facecolor('#FAFAFA')
-    sns.lineplot(data=df, x=x, y=y, ax=ax, color=COLOR_RED, linewidth=2)
-    ax.set_title(title, color=COLOR_GRAY, fontsize=13)
-    ax.set_xlabel(xlabel, color=COLOR_GRAY)
-    ax.set_ylabel(ylabel, color=COLOR_GRAY)
-    ax.tick_params(colors=COLOR_GRAY)
-    for sp in ['top','right']: ax.spines[sp].set_visible(False)
-    ax.spines['left'].set_color(COLOR_GRAY_LIGHT)
-    ax.spines['bottom'].set_color(COLOR_GRAY_LIGHT)
-    ax.tick_params(axis='x', labelrotation=90)
-    return fig
-
-def render_bar(df, x, y, title, xlabel, ylabel, figsize=(14, 7), color=COLOR_RED):
-    fig, ax = new_figure(figsize)
-    fig.patch.set_facecolor('white')
-    ax.set_facecolor('#FAFAFA')
-    sns.barplot(data=df, x=x, y=y, color=color, ax=ax)
-    ax.set_title(title, color=COLOR_GRAY, fontsize=13)
-    ax.set_xlabel(xlabel, color=COLOR_GRAY)
-    ax.set_ylabel(ylabel, color=COLOR_GRAY)
-    ax.tick_params(colors=COLOR_GRAY)
-    for sp in ['top','right']: ax.spines[sp].set_visible(False)
-    ax.spines['left'].set_color(COLOR_GRAY_LIGHT)
-    ax.spines['bottom'].set_color(COLOR_GRAY_LIGHT)
-    ax.tick_params(axis='x', labelrotation=90)
-    for c in ax.containers:
-        ax.bar_label(c, color=COLOR_GRAY, fontsize=8)
-    return fig
-
-
-def render_calendar_heatmap(df_daily_total: pd.DataFrame, year: int, month: int):
-    """Calendar heatmap for a given year/month. Rows=weeks, cols=weekdays."""
-    import calendar
-    import numpy as np
-
-    MONTH_NAMES = ['January','February','March','April','May','June',
-                   'July','August','September','October','November','December']
-
-    tmp = df_daily_total.copy()
-    tmp['date'] = pd.to_datetime(tmp['date'])
-    tmp = tmp[(tmp['date'].dt.year == year) & (tmp['date'].dt.month == month)]
-
-    first_day = pd.Timestamp(year, month, 1)
-    all_dates = pd.date_range(first_day, periods=calendar.monthrange(year, month)[1])
-    date_to_count = tmp.set_index('date')['total_watch_count'].to_dict()
-
-    start_weekday = first_day.weekday()  # 0=Mon
-    num_days  = len(all_dates)
-    num_weeks = (start_weekday + num_days + 6) // 7
-
-    grid       = np.full((num_weeks, 7), np.nan)
-    day_labels = np.full((num_weeks, 7), '', dtype=object)
-
-    for i, d in enumerate(all_dates):
-        col = d.weekday()
-        row = (start_weekday + i) // 7
-        grid[row, col]       = date_to_count.get(d, 0)
-        day_labels[row, col] = str(d.day)
-
-    weekday_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-
-    fig, ax = new_figure((10, max(2.5, num_weeks * 1.0)))
-    fig.patch.set_facecolor('#FAFAFA')
-    ax.set_facecolor('#FAFAFA')
-
-    cmap  = mcolors.LinearSegmentedColormap.from_list('cal_cmap', ['#F5F5F5', '#B0B0B0', '#A63228'])
-    vmax  = np.nanmax(grid) if not np.all(np.isnan(grid)) else 1
-
-    plot_grid = np.where(np.isnan(grid), -1, grid)
-    masked    = np.ma.masked_where(plot_grid < 0, plot_grid)
-    im        = ax.imshow(masked, cmap=cmap, vmin=0, vmax=vmax, aspect='auto')
-
-    # nan セル（月外）を白塗り
-    nan_cmap = mcolors.ListedColormap(['white'])
-    nan_grid = np.ma.masked_where(plot_grid >= 0, plot_grid)
-    ax.imshow(nan_grid, cmap=nan_cmap, vmin=0, vmax=1, aspect='auto')
-
-    for r in range(num_weeks):
-        for c in range(7):
-            if day_labels[r, c]:
-                count_val  = grid[r, c]
-                text_color = 'white' if (not np.isnan(count_val) and count_val > vmax * 0.6) else COLOR_GRAY
-                ax.text(c, r - 0.15, day_labels[r, c], ha='center', va='center',
-                        fontsize=11, color=text_color, fontweight='bold')
-                if not np.isnan(count_val) and count_val > 0:
-                    ax.text(c, r + 0.25, str(int(count_val)), ha='center', va='center',
-                            fontsize=8, color=text_color)
-
-    ax.set_xticks(range(7))
-    ax.set_xticklabels(weekday_names, color=COLOR_GRAY, fontsize=10)
-    ax.set_yticks([])  # Week表記なし
-    ax.tick_params(length=0)
-    for spine in ax.spines.values():
-        spine.set_visible(False)
-
-    fig.colorbar(im, ax=ax, label='Views', shrink=0.6)
-    ax.set_title(f'{MONTH_NAMES[month-1]} {year}  —  Calendar Heatmap',
-                 color=COLOR_GRAY, fontsize=13, pad=12)
-    fig.tight_layout()
-    return fig
-
-# ---------------------------------------
-# データ読み込み・前処理
-# ---------------------------------------
-@st.cache_data(show_spinner=False)
-def load_and_process_data(uploaded_file):
-    if uploaded_file is None:
-        return None, None
-
-    data = json.load(uploaded_file)
-    df = pd.DataFrame(data)
-
-    df['time'] = pd.to_datetime(df['time'], utc=True, errors='coerce')
-    df['video_id'] = df['titleUrl'].str.extract(r'v=([^&]+)')
-
-    # subtitles からチャンネル名を抽出（subtitles[0].name）
-    def extract_channel(subtitles):
-        if isinstance(subtitles, list) and len(subtitles) > 0:
-            return subtitles[0].get('name', None)
-        return None
-
-    df['channel_name'] = df['subtitles'].apply(extract_channel)
-
-    df_processed = df.dropna(subset=['video_id']).copy()
-    df_processed['time_jst'] = df_processed['time'].dt.tz_convert('Asia/Tokyo')
-
-    # video_info_dict：video_id → {title, thumbnail_url, channel_name}
-    video_info_dict = {}
-    for _, row in df_processed.iterrows():
-        vid = row['video_id']
-        # 日本語履歴は接尾辞 "... を視聴しました"、英語履歴は接頭辞 "Watched ..."。
-        title = row['title'].replace(" を視聴しました", "")
-        if title.startswith("Watched "):
-            title = title[len("Watched "):]
-        title = title.strip()
-        thumb_url = f"http://img.youtube.com/vi/{vid}/hqdefault.jpg"
-        channel = row.get('channel_name', None)
-        video_info_dict[vid] = {
-            'title': title,
-            'thumbnail_url': thumb_url,
-            'channel_name': channel if pd.notna(channel) else '不明'
-        }
-
-    return df_processed, video_info_dict
-
-
-def apply_filters(df_processed: pd.DataFrame, channel_filter: list, date_range: tuple) -> pd.DataFrame:
-    """チャンネル絞り込み・期間絞り込みを適用して df_processed を返す。"""
-    df = df_processed.copy()
-    start_date, end_date = date_range
-    dates = df['time_jst'].dt.normalize().dt.tz_localize(None).dt.date
-    df = df[(dates >= start_date) & (dates <= end_date)]
-    if channel_filter:
-        df = df[df['channel_name'].isin(channel_filter)]
-    return df
-
-
-def build_aggregates(df_processed: pd.DataFrame):
-    """フィルタ済み df_processed から各種集計を作成して返す。"""
-    if df_processed is None or df_processed.empty:
-        return None, None, None, None
-
-    # 動画別日次
-    df_daily = (
-        df_processed
-        .groupby([df_processed['time_jst'].dt.date, 'video_id'])
-        .size()
-        .reset_index(name='daily_watch_count')
-    )
-    df_daily.columns = ['time_jst', 'video_id', 'daily_watch_count']
-    df_daily['time'] = pd.to_datetime(df_daily['time_jst'])
-
-    # 動画別累積
-    df_cumulative = df_daily.sort_values(['video_id', 'time']).copy()
-    df_cumulative['cumulative_watch_count'] = (
-        df_cumulative.groupby('video_id')['daily_watch_count'].cumsum()
-    )
-
-    # 全体日次
-    df_daily_total = (
-        df_processed['time_jst'].dt.normalize().dt.tz_localize(None)
-        .value_counts().sort_index().reset_index()
-    )
-    df_daily_total.columns = ['date', 'total_watch_count']
-    df_daily_total['date'] = pd.to_datetime(df_daily_total['date'])
-
-    # 全体月次
-    df_monthly_total = (
-        df_processed['time_jst'].dt.to_period('M').value_counts().sort_index().reset_index()
-    )
-    df_monthly_total.columns = ['month', 'total_watch_count']
-    df_monthly_total['month'] = df_monthly_total['month'].astype(str)
-
-    return df_daily, df_cumulative, df_daily_total, df_monthly_total
-
-
-def build_scoreboard(df_cumulative: pd.DataFrame, video_info_dict: dict) -> pd.DataFrame:
-    if df_cumulative is None or df_cumulative.empty:
-        return pd.DataFrame(columns=['video_id','cumulative_watch_count','title','thumbnail_url','channel_name'])
-
-    latest_idx = df_cumulative.groupby('video_id')['time'].idxmax()
-    df_latest = df_cumulative.loc[latest_idx, ['video_id', 'cumulative_watch_count']]
-
-    df_info = pd.DataFrame.from_dict(video_info_dict, orient='index').reset_index()
-    df_info.columns = ['video_id', 'title', 'thumbnail_url', 'channel_name']
-
-    out = pd.merge(df_latest, df_info, on='video_id', how='left')
-    out = out.sort_values('cumulative_watch_count', ascending=False).reset_index(drop=True)
-    return out.head(50)
-
 # ---------------------------------------
 # ダッシュボード描画
 # ---------------------------------------
 def show_dashboard(
-    df_daily_total, df_monthly_total, df_daily, df_cumulative,
+    df_daily_total, df_monthly_total, df_cumulative,
     video_info_dict, df_scoreboard=None, video_id=None,
-    cal_year=None, cal_month=None
+    cal_year=None, cal_month=None, video_slice=None
 ):
     if video_id is None:
         # ---- 全体統計 ----
@@ -333,37 +68,37 @@ def show_dashboard(
         if df_daily_total is not None and not df_daily_total.empty:
             st.markdown("---")
             st.subheader('Daily Total Views Heatmap')
-            pt = _weekday_pivot(
+            pt = weekday_pivot(
                 df_daily_total.rename(columns={'date': 'date_for_pivot'}),
                 date_col='date_for_pivot', value_col='total_watch_count'
             )
-            st.pyplot(render_heatmap(pt, 'Daily Total Views Heatmap'))
+            st.altair_chart(render_heatmap(pt, 'Daily Total Views Heatmap'), width='stretch', theme=None)
 
             # カレンダー型ヒートマップ
             if cal_year is not None and cal_month is not None:
                 st.markdown("---")
                 st.subheader(f'📅 Calendar Heatmap')
-                st.pyplot(render_calendar_heatmap(df_daily_total, cal_year, cal_month))
+                st.image(render_calendar_heatmap(df_daily_total, cal_year, cal_month), width='stretch')
 
             st.markdown("---")
             st.subheader('Daily Total Views')
-            most_day = df_daily_total.loc[df_daily_total['total_watch_count'].idxmax()]
-            st.pyplot(render_bar(
+            most_day, most_day_views = find_peak(df_daily_total, 'date', 'total_watch_count')
+            st.altair_chart(render_bar(
                 df_daily_total, x='date', y='total_watch_count',
                 title='Daily Total Views', xlabel='Date', ylabel='Total Views'
-            ))
-            st.markdown(f"**💡 Most watched day:** `{pd.to_datetime(most_day['date']).date()}` ({most_day['total_watch_count']} views)")
+            ), width='stretch', theme=None)
+            st.markdown(f"**💡 Most watched day:** `{most_day.date()}` ({most_day_views} views)")
 
         if df_monthly_total is not None and not df_monthly_total.empty:
             st.markdown("---")
             st.subheader('Monthly Total Views')
-            most_month = df_monthly_total.loc[df_monthly_total['total_watch_count'].idxmax()]
-            st.pyplot(render_bar(
+            most_month, most_month_views = find_peak(df_monthly_total, 'month', 'total_watch_count')
+            st.altair_chart(render_bar(
                 df_monthly_total, x='month', y='total_watch_count',
                 title='Monthly Total Views', xlabel='Month', ylabel='Total Views',
                 figsize=(12, 6), color=COLOR_GRAY
-            ))
-            st.markdown(f"**💡 Most watched month:** `{most_month['month']}` ({most_month['total_watch_count']} views)")
+            ), width='stretch', theme=None)
+            st.markdown(f"**💡 Most watched month:** `{most_month}` ({most_month_views} views)")
 
     else:
         # ---- 動画別 ----
@@ -382,75 +117,84 @@ def show_dashboard(
                 unsafe_allow_html=True
             )
 
-        df_v = df_cumulative[df_cumulative['video_id'] == video_id].copy()
-        if df_v.empty:
+        # build_aggregates で求めた行範囲から、その動画の行だけを切り出す
+        if video_slice is None or video_id not in video_slice:
             st.warning('No data found for this video.')
             return
-        df_v['date'] = pd.to_datetime(df_v['time'].dt.date)
+        start, end = video_slice[video_id]
+        df_v = df_cumulative.iloc[start:end]  # Copy-on-Write なので列追加時も元の表は変わらない
+        df_v['date'] = df_v['time']  # time はすでに日単位の datetime64（dt.date で Python オブジェクト化しない）
 
         # ---- Daily Heatmap（横長）----
-        heat_src = df_daily[df_daily['video_id'] == video_id].copy()
-        if not heat_src.empty:
-            st.markdown("---")
-            st.subheader('Daily View Count Heatmap')
-            pt = _weekday_pivot(
-                heat_src.rename(columns={'time_jst': 'date_for_pivot'}),
-                date_col='date_for_pivot', value_col='daily_watch_count'
-            )
-            st.pyplot(render_heatmap(pt, 'Daily Views Heatmap'))
+        # df_cumulative は動画別の日次値も持っているので、日次の値も df_v から取れる
+        st.markdown("---")
+        st.subheader('Daily View Count Heatmap')
+        pt = weekday_pivot(
+            df_v[['time', 'daily_watch_count']].rename(columns={'time': 'date_for_pivot'}),
+            date_col='date_for_pivot', value_col='daily_watch_count'
+        )
+        st.altair_chart(render_heatmap(pt, 'Daily Views Heatmap'), width='stretch', theme=None)
 
-            # ---- Calendar Heatmap ----
-            if cal_year is not None and cal_month is not None:
-                # 動画別の日次データを df_daily_total 相当の形式に変換して渡す
-                df_v_daily_fmt = heat_src.rename(columns={'time_jst': 'date', 'daily_watch_count': 'total_watch_count'})[['date', 'total_watch_count']].copy()
-                df_v_daily_fmt['date'] = pd.to_datetime(df_v_daily_fmt['date'])
-                st.markdown("---")
-                st.subheader('📅 Calendar Heatmap')
-                st.pyplot(render_calendar_heatmap(df_v_daily_fmt, cal_year, cal_month))
-        else:
-            st.info('No data available for heatmap.')
+        # ---- Calendar Heatmap ----
+        if cal_year is not None and cal_month is not None:
+            # 動画別の日次データを df_daily_total 相当の形式に変換して渡す（time は datetime64 のまま使える）
+            df_v_daily_fmt = df_v[['time', 'daily_watch_count']].rename(columns={'time': 'date', 'daily_watch_count': 'total_watch_count'})
+            st.markdown("---")
+            st.subheader('📅 Calendar Heatmap')
+            st.image(render_calendar_heatmap(df_v_daily_fmt, cal_year, cal_month), width='stretch')
 
         # ---- Daily Views 棒グラフ ----
         st.markdown("---")
         st.subheader('Daily Views')
-        most_day = df_v.loc[df_v['daily_watch_count'].idxmax()]
-        st.pyplot(render_bar(
+        most_day, most_day_views = find_peak(df_v, 'date', 'daily_watch_count')
+        st.altair_chart(render_bar(
             df_v, x='date', y='daily_watch_count',
             title='Daily Views', xlabel='Date', ylabel='Views'
-        ))
-        st.markdown(f"**💡 Most watched day:** `{pd.to_datetime(most_day['date']).date()}` ({most_day['daily_watch_count']} views)")
+        ), width='stretch', theme=None)
+        st.markdown(f"**💡 Most watched day:** `{most_day.date()}` ({most_day_views} views)")
 
         # ---- Monthly Views 棒グラフ ----
-        df_v_monthly = df_v.copy()
-        df_v_monthly['month'] = df_v_monthly['date'].dt.to_period('M').astype(str)
-        df_v_monthly_agg = df_v_monthly.groupby('month')['daily_watch_count'].sum().reset_index()
-        df_v_monthly_agg.columns = ['month', 'total_watch_count']
+        # df_v は日付順なので月キーも出現順に並んでいる。groupby のキーソートは省く
+        month = df_v['date'].dt.to_period('M').astype(str).rename('month')
+        df_v_monthly_agg = (
+            df_v['daily_watch_count'].groupby(month, sort=False).sum()
+            .reset_index(name='total_watch_count')
+        )
         if not df_v_monthly_agg.empty:
             st.markdown("---")
             st.subheader('Monthly Views')
-            most_month = df_v_monthly_agg.loc[df_v_monthly_agg['total_watch_count'].idxmax()]
-            st.pyplot(render_bar(
+            most_month, most_month_views = find_peak(df_v_monthly_agg, 'month', 'total_watch_count')
+            st.altair_chart(render_bar(
                 df_v_monthly_agg, x='month', y='total_watch_count',
                 title='Monthly Views', xlabel='Month', ylabel='Views',
                 figsize=(12, 6), color=COLOR_GRAY
-            ))
-            st.markdown(f"**💡 Most watched month:** `{most_month['month']}` ({most_month['total_watch_count']} views)")
+            ), width='stretch', theme=None)
+            st.markdown(f"**💡 Most watched month:** `{most_month}` ({most_month_views} views)")
 
         # ---- Cumulative Views 折れ線 ----
         st.markdown("---")
         st.subheader('Cumulative Views')
-        st.pyplot(render_line(
+        st.altair_chart(render_line(
             df_v, x='date', y='cumulative_watch_count',
             title='Cumulative Views', xlabel='Date', ylabel='Cumulative Views'
-        ))
+        ), width='stretch', theme=None)
 
         # ---- 詳細データ表 ----
         st.markdown("---")
         st.subheader('Detail Data')
+        df_detail = df_v[['date', 'daily_watch_count', 'cumulative_watch_count']]
+        if len(df_detail) > DETAIL_TABLE_LIMIT:
+            st.caption(f'直近 {DETAIL_TABLE_LIMIT} 日分を表示しています（全 {len(df_detail)} 日分は CSV でダウンロードできます）。')
         st.dataframe(
-            df_v[['date', 'daily_watch_count', 'cumulative_watch_count']],
+            df_detail.tail(DETAIL_TABLE_LIMIT),
             use_container_width=True, hide_index=True
         )
+        # CSV はボタンが押されたときにだけ作る（再実行のたびに全行を書き出さない）
+        st.download_button(
+            'Download CSV',
+            data=lambda: df_detail.to_csv(index=False).encode('utf-8'),
+            file_name=f'{video_id}.csv', mime='text/csv'
+        )
 
 # ---------------------------------------
 # メインアプリ
@@ -463,6 +207,10 @@ def main():
     uploaded_file = st.sidebar.file_uploader(
         "watch-history.jsonファイルをアップロードしてください", type=["json"]
     )
+    st.sidebar.caption(
+        '読み込んだ履歴は次回の読み込みを速くするため、前処理済みの形でサーバー上に保存されます'
+        '（古いものから自動で削除）。'
+    )
 
     df_processed, video_info_dict = load_and_process_data(uploaded_file)
 
@@ -498,7 +246,7 @@ def main():
         return
 
     # ---- 集計 ----
-    df_daily, df_cumulative, df_daily_total, df_monthly_total = build_aggregates(df_filtered)
+    df_cumulative, df_daily_total, df_monthly_total, video_slice = build_aggregates(df_filtered)
 
     # フィルタ済みの video_info_dict（絞り込み後の動画のみ）
     filtered_ids = set(df_filtered['video_id'].unique())
@@ -529,20 +277,21 @@ def main():
     st.sidebar.markdown("---")
     st.sidebar.subheader('🎬 動画選択')
     OVERALL_LABEL = '--- 全体統計を表示 ---'
-    title_to_id = {}
-    for vid, info in filtered_video_info.items():
-        label = info['title']
-        if label in title_to_id:
-            existing_vid = title_to_id[label]
-            title_to_id[f"{label} [{existing_vid}]"] = existing_vid
-            del title_to_id[label]
-            title_to_id[f"{label} [{vid}]"] = vid
-        else:
-            title_to_id[label] = vid
-
-    selector_options = [OVERALL_LABEL] + sorted(title_to_id.keys())
-    selected_label = st.sidebar.selectbox('表示したい動画を選択してください:', selector_options)
-    selected_video_id = None if selected_label == OVERALL_LABEL else title_to_id.get(selected_label)
+    OTHER_LABEL = '--- 一覧に無い動画を動画IDで指定 ---'
+    title_to_id = build_video_options(df_cumulative, filtered_video_info)
+    selector_options = [OVERALL_LABEL, OTHER_LABEL] + list(title_to_id)
+    selected_label = st.sidebar.selectbox(
+        f'表示したい動画を選択してください（視聴回数上位{VIDEO_SELECTOR_LIMIT}件）:', selector_options
+    )
+    if selected_label == OVERALL_LABEL:
+        selected_video_id = None
+    elif selected_label == OTHER_LABEL:
+        # 上位に入らない動画は video_id を直接入力して表示する。
+        # 入力欄はこの項目を選んだときだけ出すので、一覧からの選択を上書きしない
+        video_id_input = st.sidebar.text_input('動画ID:', value='').strip()
+        selected_video_id = video_id_input or None
+    else:
+        selected_video_id = title_to_id.get(selected_label)
 
     # ---- 絞り込み状況バッジ ----
     filter_notes = [f"期間: {date_start} 〜 {date_end}"]
@@ -554,13 +303,13 @@ def main():
     show_dashboard(
         df_daily_total=df_daily_total,
         df_monthly_total=df_monthly_total,
-        df_daily=df_daily,
         df_cumulative=df_cumulative,
         video_info_dict=filtered_video_info,
         df_scoreboard=df_scoreboard,
         video_id=selected_video_id,
         cal_year=cal_year,
-        cal_month=cal_month
+        cal_month=cal_month,
+        video_slice=video_slice
     )
 
     with st.expander("元のデータ (プレビュー)"):
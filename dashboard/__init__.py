@@ -0,0 +1 @@
+"""YouTube視聴履歴ダッシュボードの共通処理（データ処理・グラフ描画）。"""
@@ -0,0 +1,760 @@
+# -*- coding: utf-8 -*-
+# YouTube視聴履歴ダッシュボードの共通処理
+# データ読み込み・前処理・集計と、グラフ描画ユーティリティ
+# ------------------------------------------------------------
+# Streamlit はウィジェット操作のたびに app.py を先頭から再実行するが、
+# import されたモジュールはプロセス内で一度だけ読み込まれる。
+# 関数定義やキャッシュ設定をここに置き、再実行ごとのコストを app.py 側の
+# 画面組み立てだけに抑える。
+
+import streamlit as st
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # サーバー描画用のスレッドセーフな非対話バックエンド
+from matplotlib.figure import Figure
+import matplotlib.colors as mcolors
+import altair as alt
+import numpy as np
+import calendar
+import io
+import json
+import hashlib
+import threading
+import os
+import shutil
+from pathlib import Path
+
+try:
+    import orjson  # 大きな履歴ファイルの JSON パースを高速化（任意依存）
+except ImportError:
+    orjson = None
+
+try:
+    import ijson  # 履歴 JSON をストリーム読みしてピークメモリを抑える（任意依存）
+except ImportError:
+    ijson = None
+
+try:
+    import polars as pl  # JSON の読み込みと列の整形を Arrow ベースで一括処理する（任意依存）
+except ImportError:
+    pl = None
+
+# Streamlit はスクリプトをセッションごとの別スレッドで実行するため、numba の並列カーネルも
+# 複数のスレッドから呼ばれる。スレッドセーフな OpenMP を TBB より優先して選ばせる
+# （TBB はメインスレッド以外から起動すると、プロセス終了時に固まることがある）。
+# numba は import 時に環境変数から設定を読むので、import より前に既定値として入れておく。
+os.environ.setdefault('NUMBA_THREADING_LAYER_PRIORITY', 'omp tbb workqueue')
+
+try:
+    from numba import njit, prange  # 動画別累積の計算を並列化する（任意依存）
+except ImportError:
+    njit = None
+
+# ---------------------------------------
+# カラーパレット定義（落ち着いた赤・灰色ベース）
+# ---------------------------------------
+COLOR_RED        = '#A63228'
+COLOR_RED_LIGHT  = '#C9736B'
+COLOR_GRAY       = '#6B6B6B'
+COLOR_GRAY_LIGHT = '#B0B0B0'
+
+HEATMAP_COLORS = ['#F5F5F5', '#B0B0B0', '#A63228']
+HEATMAP_CMAP = mcolors.LinearSegmentedColormap.from_list('gray_red', HEATMAP_COLORS)
+
+# 棒・折れ線・ヒートマップは Altair（Vega-Lite）でブラウザ側に描画させ、
+# サーバーでの PNG ラスタライズを省く。旧 matplotlib 版の figsize（インチ）は
+# 高さ（px）に換算して使う。
+CHART_PX_PER_INCH = 50
+
+# カレンダーヒートマップ（matplotlib）の PNG 書き出し設定。st.pyplot の既定値と同じ。
+# Figure は使い回して PNG にしてから st.image で表示する。
+CALENDAR_SAVEFIG_OPTIONS = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+# 動画セレクタに並べる最大件数（累積視聴回数の上位から）。
+# 全動画を選択肢にすると数万件になり、毎回の再実行でウィジェットへ送る量も増える。
+VIDEO_SELECTOR_LIMIT = 100
+
+# 動画別「Detail Data」表に表示する最大行数（新しい日付から）。
+# 表は再実行のたびに Arrow へ変換してブラウザへ送るため、全期間分は CSV ダウンロードで渡す。
+DETAIL_TABLE_LIMIT = 1000
+
+# ---------------------------------------
+# 前処理結果のディスクキャッシュ
+# ---------------------------------------
+# サーバー再起動後も同じファイルなら JSON パースと前処理を省略できるよう、
+# load_and_process_data の結果を Parquet で保存しておく。
+# 前処理の出力形式を変えたときは DISK_CACHE_VERSION を上げて古いキャッシュを無効化する。
+DISK_CACHE_DIR = Path.home() / '.cache' / 'yt_dash'
+DISK_CACHE_VERSION = 5
+# キャッシュ全体の上限。超えたら古い（最終書き込みが古い）ファイルのキャッシュから消す。
+DISK_CACHE_MAX_BYTES = 512 * 1024 ** 2
+
+# ---------------------------------------
+# Matplotlib フォント設定
+# ---------------------------------------
+# グラフ内の文字はすべて英語にしているため、デフォルトフォントのままで
+# 文字化けしない。負の符号だけ環境依存を避けるため設定しておく。
+matplotlib.rcParams['axes.unicode_minus'] = False
+
+# ---------------------------------------
+# pandas 設定
+# ---------------------------------------
+# Copy-on-Write を有効にし、防御的な .copy() を省いても元の DataFrame
+# （キャッシュで共有される前処理結果など）が書き換わらないようにする。
+# pandas 3.0 以降は常に有効で、オプション自体が非推奨になっている。
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+def new_figure(figsize):
+    """pyplot を介さず Figure を生成する。
+
+    pyplot（plt.*）はグローバルな状態を持ちスレッドセーフではないため、
+    Streamlit のスクリプト実行スレッド上で使うとネイティブクラッシュ
+    （Segmentation fault）を起こしうる。オブジェクト指向 API で直接
+    Figure を作れば、スレッド安全かつ図がグローバル登録されないので
+    メモリにも蓄積しない。
+    """
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    return fig, ax
+
+# ---------------------------------------
+# 共通ピボット＆描画ユーティリティ
+# ---------------------------------------
+def _frame_hash(df: pd.DataFrame):
+    """描画キャッシュ用の DataFrame のハッシュ（形状・列名・全セルの値）。"""
+    return df.shape, tuple(df.columns), hash(pd.util.hash_pandas_object(df).to_numpy().tobytes())
+
+# 同じ入力で作り直さないよう、ピボットやチャートは参照のままキャッシュして使い回す
+# （全体統計 ⇔ 動画別を行き来したとき、動画や月の選択だけを変えたときなど）。
+# 返り値はセッション間で共有されるので、呼び出し側では加工しないこと。
+_chart_cache = st.cache_resource(show_spinner=False, max_entries=16, hash_funcs={pd.DataFrame: _frame_hash})
+
+@_chart_cache
+def weekday_pivot(df: pd.DataFrame, date_col: str, value_col: str) -> pd.DataFrame:
+    """日付ごとの値を 行=曜日、列=(年月, 日) の表に組み替える（欠けたセルは 0、現れない曜日の行は NaN）。"""
+    dt = pd.to_datetime(df[date_col])  # 日時変換は一度だけ行い、派生値はすべてここから作る
+    weekday_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    if dt.empty:
+        empty_cols = pd.MultiIndex.from_arrays([[], []], names=['month_year', 'day'])
+        return pd.DataFrame(index=pd.Index(weekday_names, name='weekday'), columns=empty_cols)
+
+    # (年月, 日) を「先頭月からの月数 × 31 + 日」の整数に詰め、7 × (月数 × 31) の
+    # 密な配列へ np.add.at で直接足し込む。pivot_table / unstack のような
+    # MultiIndex の組み替えは行わず、最後に値のある列だけを取り出して表にする。
+    months = dt.dt.year.to_numpy() * 12 + dt.dt.month.to_numpy() - 1
+    first_month = months.min()
+    flat = (months - first_month) * 31 + dt.dt.day.to_numpy() - 1
+    n_cols = (months.max() - first_month + 1) * 31
+    weekdays = dt.dt.dayofweek.to_numpy()
+    values = df[value_col].to_numpy()
+    mat = np.zeros((7, n_cols), dtype=values.dtype)
+    np.add.at(mat, (weekdays, flat), values)
+
+    used = np.flatnonzero(np.bincount(flat, minlength=n_cols))
+    used_months = first_month + used // 31
+    month_labels = [f'{m // 12:04d}-{m % 12 + 1:02d}' for m in used_months.tolist()]
+    columns = pd.MultiIndex.from_arrays([month_labels, used % 31 + 1], names=['month_year', 'day'])
+    pivot = pd.DataFrame(mat[:, used], index=pd.Index(weekday_names, name='weekday'), columns=columns)
+    # 従来の pivot_table(fill_value=0) + reindex と同じく、データに一度も現れない曜日の行だけは NaN
+    seen = np.bincount(weekdays, minlength=7) > 0
+    return pivot if seen.all() else pivot.where(pd.Series(seen, index=pivot.index), axis=0)
+
+def _style_chart(chart, title, height):
+    """Altair チャートにタイトル・サイズと共通の配色（赤・灰色ベース）を設定する。"""
+    return (
+        chart
+        .properties(title=alt.TitleParams(title, color=COLOR_GRAY, fontSize=13), height=height)
+        .configure(background='white')
+        .configure_view(fill='#FAFAFA', strokeWidth=0)
+        .configure_axis(
+            labelColor=COLOR_GRAY, titleColor=COLOR_GRAY,
+            domainColor=COLOR_GRAY_LIGHT, tickColor=COLOR_GRAY_LIGHT, gridColor='#EEEEEE'
+        )
+        .configure_legend(labelColor=COLOR_GRAY, titleColor=COLOR_GRAY)
+    )
+
+def _x_encoding(df, x, xlabel, discrete):
+    """x 軸のエンコーディング。日付列は日単位で表示し、棒グラフでは1日1本の離散軸にする。"""
+    axis = alt.Axis(labelAngle=-90)
+    if pd.api.types.is_datetime64_any_dtype(df[x]):
+        return alt.X(f'yearmonthdate({x}):{"O" if discrete else "T"}', title=xlabel, axis=axis)
+    return alt.X(f'{x}:{"O" if discrete else "Q"}', title=xlabel, axis=axis)
+
+@_chart_cache
+def render_heatmap(pivot_table, title, cbar_label='Views', figsize=(20, 8)):
+    # ピボット（行=曜日, 列=(年月, 日)）を Altair 用の縦持ちに戻す
+    col_labels = [f'{m}-{d}' for m, d in pivot_table.columns]
+    row_labels = list(pivot_table.index)
+    long = pd.DataFrame({
+        'weekday': np.repeat(row_labels, len(col_labels)),
+        'column': np.tile(col_labels, len(row_labels)),
+        'value': pivot_table.to_numpy().ravel(),
+    })
+    chart = alt.Chart(long).mark_rect(stroke='#E0E0E0', strokeWidth=.5).encode(
+        x=alt.X('column:O', sort=col_labels, title='Year-Month - Day', axis=alt.Axis(labelAngle=-90)),
+        y=alt.Y('weekday:O', sort=row_labels, title='Weekday'),
+        color=alt.Color('value:Q', title=cbar_label,
+                        scale=alt.Scale(range=HEATMAP_COLORS)),
+        tooltip=[alt.Tooltip('column:O', title='Date'), alt.Tooltip('value:Q', title=cbar_label)],
+    )
+    return _style_chart(chart, title, figsize[1] * CHART_PX_PER_INCH)
+
+@_chart_cache
+def render_line(df, x, y, title, xlabel, ylabel, figsize=(14, 7)):
+    chart = alt.Chart(df[[x, y]]).mark_line(color=COLOR_RED, strokeWidth=2).encode(
+        x=_x_encoding(df, x, xlabel, discrete=False),
+        y=alt.Y(f'{y}:Q', title=ylabel),
+        tooltip=[x, y],
+    )
+    return _style_chart(chart, title, figsize[1] * CHART_PX_PER_INCH)
+
+@_chart_cache
+def render_bar(df, x, y, title, xlabel, ylabel, figsize=(14, 7), color=COLOR_RED):
+    base = alt.Chart(df[[x, y]]).encode(
+        x=_x_encoding(df, x, xlabel, discrete=True),
+        y=alt.Y(f'{y}:Q', title=ylabel),
+    )
+    bars = base.mark_bar(color=color).encode(tooltip=[x, y])
+    labels = base.mark_text(dy=-6, color=COLOR_GRAY, fontSize=8).encode(text=f'{y}:Q')
+    return _style_chart(bars + labels, title, figsize[1] * CHART_PX_PER_INCH)
+
+
+@st.cache_resource(show_spinner=False)
+def _calendar_canvas(num_weeks: int) -> dict:
+    """週数ごとに1枚だけ作って使い回すカレンダー用の Figure と描画要素。
+
+    Figure・軸・カラーバー・各セルの文字は最初に一度だけ作り、月やデータが
+    変わったときは imshow の配列・色範囲・文字列だけを差し替える。
+    プロセス全体で共有するので、書き換えと書き出しは lock を取ってから行う。
+    """
+    fig, ax = new_figure((10, max(2.5, num_weeks * 1.0)))
+    fig.patch.set_facecolor('#FAFAFA')
+    ax.set_facecolor('#FAFAFA')
+
+    # nan セル（月外）はカラーマップの bad 色で白塗りし、1 回の imshow で描く
+    cmap = HEATMAP_CMAP.with_extremes(bad='white')
+    im = ax.imshow(np.ma.masked_invalid(np.full((num_weeks, 7), np.nan)),
+                   cmap=cmap, vmin=0, vmax=1, aspect='auto')
+
+    # 各セルの日付（太字）と視聴数の文字。表示しないセルは非表示にしておく
+    day_texts, count_texts = [], []
+    for r in range(num_weeks):
+        for c in range(7):
+            day_texts.append(ax.text(c, r - 0.15, '', ha='center', va='center',
+                                     fontsize=11, fontweight='bold', visible=False))
+            count_texts.append(ax.text(c, r + 0.25, '', ha='center', va='center',
+                                       fontsize=8, visible=False))
+
+    ax.set_xticks(range(7))
+    ax.set_xticklabels(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], color=COLOR_GRAY, fontsize=10)
+    ax.set_yticks([])  # Week表記なし
+    ax.tick_params(length=0)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    fig.colorbar(im, ax=ax, label='Views', shrink=0.6)  # im の色範囲の変更に追従する
+    title = ax.set_title('', color=COLOR_GRAY, fontsize=13, pad=12)
+    return {
+        'fig': fig, 'im': im, 'title': title,
+        'day_texts': day_texts, 'count_texts': count_texts,
+        'lock': threading.Lock(),
+    }
+
+
+@_chart_cache
+def render_calendar_heatmap(df_daily_total: pd.DataFrame, year: int, month: int) -> bytes:
+    """Calendar heatmap for a given year/month. Rows=weeks, cols=weekdays.
+
+    描画結果は PNG のバイト列で返す（Figure は _calendar_canvas で使い回すため）。
+    """
+    MONTH_NAMES = ['January','February','March','April','May','June',
+                   'July','August','September','October','November','December']
+
+    # date 列は build_aggregates の時点で datetime64 なので、変換し直さずにそのまま絞り込む
+    dates = df_daily_total['date']
+    tmp = df_daily_total[(dates.dt.year == year) & (dates.dt.month == month)]
+
+    # 月内の各日の視聴数を日番号の位置に置き、月初の曜日ぶんずらして 週 × 7 の格子にする。
+    # 月外のセルは nan（描画時は白）。日付ごとの Python ループは使わない。
+    start_weekday, num_days = calendar.monthrange(year, month)  # 0=Mon
+    num_weeks = (start_weekday + num_days + 6) // 7
+    counts = np.zeros(num_days)
+    counts[tmp['date'].dt.day.to_numpy() - 1] = tmp['total_watch_count'].to_numpy()
+    cells = np.full(num_weeks * 7, np.nan)
+    cells[start_weekday:start_weekday + num_days] = counts
+    grid = cells.reshape(num_weeks, 7)
+    vmax = counts.max()
+
+    canvas = _calendar_canvas(num_weeks)
+    with canvas['lock']:
+        canvas['im'].set_data(np.ma.masked_invalid(grid))
+        canvas['im'].set_clim(0, vmax)
+        for i, (day_text, count_text) in enumerate(zip(canvas['day_texts'], canvas['count_texts'])):
+            day = i - start_weekday + 1
+            if not 1 <= day <= num_days:
+                day_text.set_visible(False)
+                count_text.set_visible(False)
+                continue
+            count_val = counts[day - 1]
+            text_color = 'white' if count_val > vmax * 0.6 else COLOR_GRAY
+            day_text.set(text=str(day), color=text_color, visible=True)
+            count_text.set(text=str(int(count_val)), color=text_color, visible=bool(count_val > 0))
+        canvas['title'].set_text(f'{MONTH_NAMES[month-1]} {year}  —  Calendar Heatmap')
+        fig = canvas['fig']
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, **CALENDAR_SAVEFIG_OPTIONS)
+    return buf.getvalue()
+
+# ---------------------------------------
+# データ読み込み・前処理
+# ---------------------------------------
+def _extract_channel(subtitles):
+    """subtitles からチャンネル名を抽出する（subtitles[0].name）。"""
+    if isinstance(subtitles, list) and len(subtitles) > 0:
+        return subtitles[0].get('name', None)
+    return None
+
+
+def _iter_watch_records(uploaded_file):
+    """watch-history.json のレコード（dict）を先頭から順に返す。
+
+    ijson があれば配列を1件ずつストリーム読みし、履歴全体を Python の
+    dict のリストとして一度に展開しない。無ければ orjson / json で
+    まとめてパースする。
+    """
+    if ijson is not None:
+        uploaded_file.seek(0)
+        yield from ijson.items(uploaded_file, 'item')
+        return
+
+    # orjson があれば使い、無ければ標準ライブラリの json にフォールバックする
+    raw = uploaded_file.getvalue() if hasattr(uploaded_file, 'getvalue') else uploaded_file.read()
+    yield from (orjson.loads(raw) if orjson is not None else json.loads(raw))
+
+
+def _file_digest(uploaded_file) -> str:
+    """アップロードされたファイル内容のハッシュ（ディスクキャッシュのキー）。"""
+    h = hashlib.blake2b(digest_size=16)
+    if hasattr(uploaded_file, 'getbuffer'):
+        with uploaded_file.getbuffer() as buf:  # BytesIO の中身をコピーせずに読む
+            h.update(buf)
+    else:
+        h.update(uploaded_file.read())
+        uploaded_file.seek(0)
+    return f'v{DISK_CACHE_VERSION}-{h.hexdigest()}'
+
+
+def _unify_dtypes(df_processed: pd.DataFrame) -> pd.DataFrame:
+    """文字列列を Arrow 文字列（video_id はそれを categories に持つカテゴリ型）にそろえる。
+
+    Polars からの変換や Parquet の読み戻しでは文字列が既定の str 型になるため、
+    どの読み込み経路でも _load_with_pandas と同じ型の DataFrame を返すようにする。
+    """
+    for col in ('video_id', 'title', 'channel_name'):
+        df_processed[col] = df_processed[col].astype('string[pyarrow]')
+    df_processed['video_id'] = df_processed['video_id'].astype('category')
+    return df_processed
+
+
+def _read_disk_cache(key: str):
+    """ディスクキャッシュがあれば (df_processed, video_info_dict) を、無ければ None を返す。"""
+    cache_dir = DISK_CACHE_DIR / key
+    try:
+        df_processed = pd.read_parquet(cache_dir / 'df_processed.parquet')
+        df_info = pd.read_parquet(cache_dir / 'video_info.parquet')
+    except (OSError, ImportError, ValueError):  # 未作成・破損・Parquet エンジン無し
+        return None
+    return _unify_dtypes(df_processed), df_info.to_dict('index')
+
+
+def _write_disk_cache(key: str, df_processed: pd.DataFrame, video_info_dict: dict) -> None:
+    """前処理結果を Parquet で保存する。書き込めない環境では何もしない。"""
+    cache_dir = DISK_CACHE_DIR / key
+    df_info = pd.DataFrame.from_dict(video_info_dict, orient='index')
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for name, frame in [('df_processed', df_processed), ('video_info', df_info)]:
+            # 書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+            tmp_path = cache_dir / f'{name}.parquet.tmp'
+            frame.to_parquet(tmp_path, compression='zstd')
+            os.replace(tmp_path, cache_dir / f'{name}.parquet')
+    except (OSError, ImportError, ValueError):
+        pass
+    _prune_disk_cache(key)
+
+
+def _prune_disk_cache(keep_key: str) -> None:
+    """古いバージョンのキャッシュを消し、全体を DISK_CACHE_MAX_BYTES 以下に保つ。
+
+    keep_key（いま書いたキャッシュ）は上限を超えていても残す。
+    """
+    try:
+        entries = [p for p in DISK_CACHE_DIR.iterdir() if p.is_dir()]
+    except OSError:
+        return
+    current = []
+    for path in entries:
+        if not path.name.startswith(f'v{DISK_CACHE_VERSION}-'):
+            shutil.rmtree(path, ignore_errors=True)  # DISK_CACHE_VERSION を上げる前のキャッシュ
+            continue
+        try:
+            files = [f.stat() for f in path.iterdir()]
+        except OSError:
+            continue
+        size = sum(st_.st_size for st_ in files)
+        mtime = max((st_.st_mtime for st_ in files), default=0)
+        current.append((mtime, size, path))
+
+    total = 0
+    for _, size, path in sorted(current, key=lambda e: e[0], reverse=True):
+        total += size
+        if total > DISK_CACHE_MAX_BYTES and path.name != keep_key:
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def _extract_video_id(urls: pd.Series) -> pd.Series:
+    """titleUrl から video_id（v= の値）を取り出す。該当しない行は欠損値。
+
+    Takeout の視聴 URL はほぼすべて ".../watch?v=<11文字のID>" で終わるため、
+    正規表現と必ず同じ結果になる行だけを固定位置のスライスで取る。条件は
+    最初の "v=" が末尾 13 文字目にあり、その直前が "?" か "&"、末尾 11 文字が
+    動画 ID の文字（英数字・"_"・"-"）だけであること。それ以外の行
+    （パラメータ付きの URL、投稿・広告の URL など）は従来の正規表現 v=([^&]+) に回す。
+    """
+    # Arrow 文字列にしておくとスライス・比較・str.extract が pyarrow の
+    # C 実装カーネルで処理される。pyarrow は streamlit の依存として必ず入っている。
+    urls = urls.astype('string[pyarrow]')
+    tail = urls.str[-11:]
+    is_tail = (
+        (urls.str.find('v=') == urls.str.len() - 13)
+        & urls.str[-14:-13].isin(['?', '&'])
+        & tail.str.fullmatch(r'[A-Za-z0-9_-]{11}')
+    )
+    is_tail = is_tail.fillna(False).astype(bool)
+    video_id = tail.where(is_tail)
+    rest = ~is_tail & urls.notna()
+    if rest.any():
+        video_id[rest] = urls[rest].str.extract(r'v=([^&]+)', expand=False)
+    return video_id
+
+
+def _load_with_pandas(uploaded_file) -> pd.DataFrame:
+    """履歴を読み込み、video_id / title / channel_name / time_jst の DataFrame を返す。"""
+    # 使うフィールドだけを列ごとのリストに取り出す。
+    # products / activityControls / details などは DataFrame に載せない。
+    # 動画 ID（v=）を含まない URL のレコード（広告・投稿・URL 無しなど）は
+    # 後段の video_id 抽出で必ず落ちるため、読みながら捨てて DataFrame を小さくする。
+    times, urls, titles, channels = [], [], [], []
+    for rec in _iter_watch_records(uploaded_file):
+        url = rec.get('titleUrl')
+        if not isinstance(url, str) or 'v=' not in url:
+            continue
+        times.append(rec.get('time'))
+        urls.append(url)
+        titles.append(rec.get('title'))
+        channels.append(_extract_channel(rec.get('subtitles')))
+    # 文字列列は Python の str オブジェクトの配列ではなく Arrow 文字列（連続したバッファ）で持つ。
+    # メモリが小さく、後段の日時解析・スライス・比較も pyarrow のカーネルで処理される。
+    df = pd.DataFrame({
+        'time': pd.array(times, dtype='string[pyarrow]'),
+        'titleUrl': pd.array(urls, dtype='string[pyarrow]'),
+        'title': pd.array(titles, dtype='string[pyarrow]'),
+        'channel_name': pd.array(channels, dtype='string[pyarrow]'),
+    })
+
+    # Takeout の time は常に UTC の ISO 8601（"...T12:34:56.789Z"、小数秒は無いこともある）。
+    # 書式を指定しないと先頭要素から推測した書式に合わない行が NaT になり、
+    # 行ごとの Python パーサにも落ちるため、ISO8601 を明示してベクトル化パスで解析する。
+    df['time'] = pd.to_datetime(df['time'], format='ISO8601', utc=True, errors='coerce')
+    # 以降の groupby・比較・ソートを整数コードで行えるようカテゴリ型にしておく
+    df['video_id'] = _extract_video_id(df['titleUrl']).astype('category')
+
+    # 以降の集計・表示で使う列だけに絞る（titleUrl は video_id 抽出後は不要、
+    # UTC の time は time_jst に置き換える）。後段の copy / sort / groupby が軽くなる。
+    df_processed = df.dropna(subset=['video_id'])[['time', 'video_id', 'title', 'channel_name']]
+    df_processed['time_jst'] = df_processed.pop('time').dt.tz_convert('Asia/Tokyo')
+    return df_processed
+
+
+def _load_with_polars(uploaded_file) -> pd.DataFrame:
+    """_load_with_pandas と同じ DataFrame を Polars で作る。
+
+    JSON の読み込みから video_id 抽出・日時変換・絞り込みまでを Polars の
+    マルチスレッドな Arrow 処理で行い、最後に一度だけ pandas へ変換する。
+    スキーマを指定して読むため、使わないフィールドは読み込まれない。
+    """
+    uploaded_file.seek(0)
+    schema = {
+        'time': pl.String,
+        'titleUrl': pl.String,
+        'title': pl.String,
+        'subtitles': pl.List(pl.Struct({'name': pl.String})),
+    }
+    df = (
+        pl.read_json(uploaded_file, schema=schema)
+        .lazy()
+        .select(
+            pl.col('titleUrl').str.extract(r'v=([^&]+)', 1).alias('video_id'),
+            pl.col('title'),
+            pl.col('subtitles').list.first().struct.field('name').alias('channel_name'),
+            pl.col('time')
+            .str.to_datetime('%Y-%m-%dT%H:%M:%S%.fZ', time_zone='UTC', strict=False)
+            .dt.convert_time_zone('Asia/Tokyo')
+            .alias('time_jst'),
+        )
+        .filter(pl.col('video_id').is_not_null())
+        .collect()
+        .to_pandas()
+    )
+    return _unify_dtypes(df)
+
+
+def _uploaded_file_key(uploaded_file):
+    """キャッシュキー用の UploadedFile のハッシュ。
+
+    Streamlit 既定のハッシュは中身をすべて読んでハッシュするため、再実行の
+    たびに履歴ファイル全体を走査することになる。file_id はアップロードごとに
+    振られる一意な ID なので、名前・サイズと合わせれば中身を読まずに識別できる。
+    """
+    return uploaded_file.name, uploaded_file.size, uploaded_file.file_id
+
+
+# file_id はアップロードのたびに変わり、同じファイルを上げ直しても別のエントリになる。
+# 前処理結果をプロセスに溜め込まないよう、件数と保持時間に上限を設ける
+# （追い出された後の再読み込みはディスクキャッシュから戻せる）。
+@st.cache_resource(
+    show_spinner=False,
+    max_entries=4,
+    ttl=3600,
+    hash_funcs={'streamlit.runtime.uploaded_file_manager.UploadedFile': _uploaded_file_key},
+)
+def load_and_process_data(uploaded_file):
+    """履歴ファイルを読み込み、前処理済み DataFrame と video_info_dict を返す。
+
+    st.cache_resource で参照のままキャッシュするため（pickle の往復なし）、
+    返り値はセッション間で共有される読み取り専用のオブジェクトとして扱うこと。
+    DataFrame は Copy-on-Write により、絞り込みや列の追加をしても元は書き換わらない
+    （apply_filters もコピーせずにそのまま絞り込む）。video_info_dict は変更しないこと。
+    """
+    if uploaded_file is None:
+        return None, None
+
+    cache_key = _file_digest(uploaded_file)
+    cached = _read_disk_cache(cache_key)
+    if cached is not None:
+        return cached
+
+    df_processed = _load_with_polars(uploaded_file) if pl is not None else _load_with_pandas(uploaded_file)
+
+    # video_info_dict：video_id → {title, thumbnail_url, channel_name}
+    # 同じ動画は何度も出現するため、先に動画単位へ絞ってからまとめて整形する。
+    # 行ごとのループで上書きしていた従来の挙動に合わせ、最後の出現を採用する。
+    uniq = df_processed.drop_duplicates('video_id', keep='last')
+    # 日本語履歴は接尾辞 "... を視聴しました"、英語履歴は接頭辞 "Watched ..."。
+    titles = (
+        uniq['title']
+        .str.replace(" を視聴しました", "", regex=False)
+        .str.removeprefix("Watched ")
+        .str.strip()
+        .to_numpy()
+    )
+    channels = uniq['channel_name'].fillna('不明').to_numpy()
+    vids = uniq['video_id'].astype(str)
+    thumbs = ('http://img.youtube.com/vi/' + vids + '/hqdefault.jpg').to_numpy()
+    video_info_dict = {
+        vid: {'title': title, 'thumbnail_url': thumb, 'channel_name': channel}
+        for vid, title, thumb, channel in zip(vids.to_numpy(), titles, thumbs, channels)
+    }
+
+    _write_disk_cache(cache_key, df_processed, video_info_dict)
+    return df_processed, video_info_dict
+
+
+def apply_filters(df_processed: pd.DataFrame, channel_filter: list, date_range: tuple) -> pd.DataFrame:
+    """チャンネル絞り込み・期間絞り込みを適用して df_processed を返す。"""
+    start_date, end_date = date_range
+    # .dt.date だと行ごとに Python の date オブジェクトができるため、
+    # datetime64 のまま日単位に切り捨てて比較する
+    days = df_processed['time_jst'].dt.floor('D').dt.tz_localize(None)
+    df = df_processed[(days >= pd.Timestamp(start_date)) & (days <= pd.Timestamp(end_date))]
+    if channel_filter:
+        df = df[df['channel_name'].isin(channel_filter)]
+    return df
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _segment_cumsum_numba(values, starts):
+        """starts[i]:starts[i+1] の各区間ごとの累積和。区間どうしは並列に計算する。"""
+        out = np.empty_like(values)
+        for i in prange(len(starts) - 1):
+            acc = 0
+            for j in range(starts[i], starts[i + 1]):
+                acc += values[j]
+                out[j] = acc
+        return out
+else:
+    _segment_cumsum_numba = None
+
+
+def _grouped_cumsum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """グループ単位の累積和。starts は各グループの開始位置に末尾 len(values) を加えた配列。
+
+    numba があれば区間ごとに並列で足し込む。無ければ全体の累積和から
+    各グループ直前までの累積和を差し引くことで、pandas の groupby を
+    経由せずに numpy だけで計算する。
+    """
+    if _segment_cumsum_numba is not None:
+        return _segment_cumsum_numba(values, starts)
+
+    cs = np.cumsum(values)
+    boundaries = starts[1:-1]
+    offsets = np.zeros_like(cs)
+    offsets[boundaries] = cs[boundaries - 1]
+    # np.cumsum は小さい整数型を 64 ビットに広げるので、入力の型に戻す
+    return (cs - np.maximum.accumulate(offsets)).astype(values.dtype, copy=False)
+
+
+def build_aggregates(df_processed: pd.DataFrame):
+    """フィルタ済み df_processed から各種集計を作成して返す。
+
+    video_slice は video_id → (開始行, 終了行) の辞書で、df_cumulative 上で
+    その動画の行が占める位置範囲を表す（df_cumulative.iloc[start:end]）。
+    """
+    if df_processed is None or df_processed.empty:
+        return None, None, None, None
+
+    # 日付キー（JST の日付を 1970-01-01 からの日数で表した整数）と動画コードを
+    # 一度だけ作り、動画別日次・全体日次・全体月次をすべてここから導く。
+    days = df_processed['time_jst'].dt.normalize().dt.tz_localize(None).to_numpy()
+    valid = ~np.isnat(days)  # groupby / value_counts と同様に日時欠損は数えない
+    day_keys = days[valid].astype('datetime64[D]').astype(np.int64)
+    # video_id はカテゴリ型なので、そのコードをそのまま動画キーに使う
+    vids = df_processed['video_id'][valid].astype('category')
+    vid_codes = vids.cat.codes.to_numpy().astype(np.int64)
+    vid_categories = vids.cat.categories
+    n_vids = len(vid_categories)
+
+    # 動画別日次：(日付, 動画) の複合キーを数える。キーは日付→動画の順に並ぶ
+    keys, daily_counts = np.unique(day_keys * n_vids + vid_codes, return_counts=True)
+    # 視聴回数は uint32 で十分。以降の並べ替え・累積和・合計で扱うバイト数が半分になる
+    daily_counts = daily_counts.astype(np.uint32)
+    key_days = keys // n_vids
+    key_vids = keys % n_vids
+    key_dates = key_days.astype('datetime64[D]')
+
+    # 動画別日次＋累積：キーは日付順なので、動画コードで安定ソートするだけで
+    # 動画→日付の順に並ぶ。DataFrame の sort_values（複数列の辞書式ソート）は使わず、
+    # 並べ替えた配列から直接組み立てる（行ラベルは日付順に並べたときの行位置）。
+    order = np.argsort(key_vids, kind='stable')
+    cum_codes = key_vids[order]
+    cum_counts = daily_counts[order]
+    # 動画の区切り位置（末尾に行数を足したもの）。累積和の区間と video_slice で共用する
+    bounds = np.r_[0, np.flatnonzero(np.diff(cum_codes)) + 1, len(cum_codes)]
+    df_cumulative = pd.DataFrame({
+        'time': key_dates[order],
+        'video_id': pd.Categorical.from_codes(cum_codes, categories=vid_categories),
+        'daily_watch_count': cum_counts,
+        'cumulative_watch_count': _grouped_cumsum(cum_counts, bounds),
+    }, index=order)
+
+    # 動画ごとの行範囲。動画を切り替えるたびに全行をマスクで走査せずに済む
+    video_slice = dict(zip(
+        vid_categories[cum_codes[bounds[:-1]]],
+        zip(bounds[:-1].tolist(), bounds[1:].tolist())
+    ))
+
+    # 全体日次：動画別日次を日付の区切りごとに合計する
+    day_starts = np.r_[0, np.flatnonzero(np.diff(key_days)) + 1]
+    uniq_days = key_days[day_starts].astype('datetime64[D]')
+    day_totals = np.add.reduceat(daily_counts, day_starts, dtype=np.uint32)
+    df_daily_total = pd.DataFrame({
+        'date': uniq_days,
+        'total_watch_count': day_totals,
+    })
+
+    # 全体月次：全体日次を月の区切りごとに合計する
+    day_months = uniq_days.astype('datetime64[M]')
+    month_starts = np.r_[0, np.flatnonzero(np.diff(day_months).astype(np.int64)) + 1]
+    df_monthly_total = pd.DataFrame({
+        'month': np.datetime_as_string(day_months[month_starts], unit='M'),
+        'total_watch_count': np.add.reduceat(day_totals, month_starts, dtype=np.uint32),
+    })
+
+    return df_cumulative, df_daily_total, df_monthly_total, video_slice
+
+
+def find_peak(df: pd.DataFrame, label_col: str, value_col: str):
+    """value_col が最大の行の (label_col の値, 最大値) を返す（同値なら先頭の行）。
+
+    .loc[idxmax()] のように行全体を Series として取り出さず、
+    numpy の argmax で位置を求めて必要な2つの値だけを読む。
+    """
+    values = df[value_col].to_numpy()
+    i = int(values.argmax())
+    return df[label_col].iat[i], values[i]
+
+
+def _latest_cumulative(df_cumulative: pd.DataFrame) -> pd.DataFrame:
+    """各動画の最新行（＝累積視聴回数が最大の行）だけを取り出す。
+
+    df_cumulative は (video_id, time) の順に並び、累積値は単調増加なので、
+    各動画の最後の行が最新になる。video_id のカテゴリコードが変わる直前の
+    位置を求めて iloc で取り出すだけなので、drop_duplicates のような
+    キーのハッシュ化は行わない。
+    """
+    codes = df_cumulative['video_id'].cat.codes.to_numpy()
+    if len(codes) == 0:
+        return df_cumulative
+    last_rows = np.r_[np.flatnonzero(np.diff(codes)), len(codes) - 1]
+    return df_cumulative.iloc[last_rows]
+
+
+def build_scoreboard(df_cumulative: pd.DataFrame, video_info_dict: dict) -> pd.DataFrame:
+    """累積視聴回数の上位動画表を返す。
+
+    キャッシュはしない。video_info_dict は app.py が再実行ごとに作り直すため、
+    キャッシュキーとしてハッシュするほうが関数を実行するより遅くなる。
+    """
+    if df_cumulative is None or df_cumulative.empty:
+        return pd.DataFrame(columns=['video_id','cumulative_watch_count','title','thumbnail_url','channel_name'])
+
+    out = (
+        _latest_cumulative(df_cumulative)[['video_id', 'cumulative_watch_count']]
+        .nlargest(50, 'cumulative_watch_count')
+        .reset_index(drop=True)
+    )
+
+    # 残った上位だけ video_info_dict を引いて動画情報を付ける
+    infos = [video_info_dict.get(vid, {}) for vid in out['video_id']]
+    for col in ['title', 'thumbnail_url', 'channel_name']:
+        out[col] = [info.get(col) for info in infos]
+    return out
+
+
+def build_video_options(df_cumulative: pd.DataFrame, video_info_dict: dict,
+                        limit: int = VIDEO_SELECTOR_LIMIT) -> dict:
+    """動画セレクタ用の {表示ラベル: video_id} を累積視聴回数の多い順に返す（上位 limit 件）。
+
+    build_scoreboard と同じ理由でキャッシュはしない（上位 limit 件だけなので作り直しても軽い）。
+    """
+    top_ids = (
+        _latest_cumulative(df_cumulative)
+        .nlargest(limit, 'cumulative_watch_count')['video_id']
+    )
+    title_to_id = {}
+    for vid in top_ids:
+        label = video_info_dict.get(vid, {}).get('title', vid)
+        # 同名タイトルは video_id を添えて区別する
+        if label in title_to_id:
+            existing_vid = title_to_id[label]
+            title_to_id[f"{label} [{existing_vid}]"] = existing_vid
+            del title_to_id[label]
+            title_to_id[f"{label} [{vid}]"] = vid
+        else:
+            title_to_id[label] = vid
+    return title_to_id
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# テスト共通の設定とサンプル履歴
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# app.py / dashboard をリポジトリ直下から import できるようにする
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from dashboard import core  # noqa: E402
+
+
+def make_history(n_videos=5, n_days=20):
+    """watch-history.json 形式のサンプル（bytes）を返す。
+
+    動画 i は i + 1 日に1回ずつ視聴されるので、視聴回数は動画番号の大きい順になる。
+    広告（titleUrl が動画でないレコード）と、小数秒の無い時刻も混ぜておく。
+    """
+    records = []
+    for i in range(n_videos):
+        vid = f'vid{i:08d}'
+        for d in range(0, n_days, max(1, n_videos - i)):
+            frac = '.123' if d % 2 else ''
+            records.append({
+                'header': 'YouTube',
+                'title': f'Video {i} を視聴しました',
+                'titleUrl': f'https://www.youtube.com/watch?v={vid}',
+                'subtitles': [{'name': f'Chan{i}', 'url': 'https://www.youtube.com/channel/x'}],
+                'time': f'2024-01-{d + 1:02d}T12:00:00{frac}Z',
+                'products': ['YouTube'],
+            })
+    records.append({'header': 'YouTube', 'title': 'Viewed ad', 'titleUrl': 'https://www.youtube.com/post/xyz',
+                    'time': '2024-01-02T00:00:00Z', 'products': ['YouTube']})
+    return json.dumps(records, ensure_ascii=False).encode('utf-8')
+
+
+@pytest.fixture(autouse=True)
+def _isolated_disk_cache(tmp_path, monkeypatch):
+    """前処理結果のディスクキャッシュをテストごとの一時ディレクトリに向ける。"""
+    monkeypatch.setattr(core, 'DISK_CACHE_DIR', tmp_path / 'yt_dash')
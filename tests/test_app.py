@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Streamlit AppTest による画面操作のテスト
+from streamlit.testing.v1 import AppTest
+
+from conftest import make_history
+
+OVERALL_LABEL = '--- 全体統計を表示 ---'
+OTHER_LABEL = '--- 一覧に無い動画を動画IDで指定 ---'
+
+
+def _run_app(data):
+    """file_uploader が data をアップロード済みとして返すようにして app.main() を実行する。"""
+    import streamlit as st
+    from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+    def uploader(*args, **kwargs):
+        rec = UploadedFileRec(file_id='test-upload', name='watch-history.json',
+                              type='application/json', data=data)
+        return UploadedFile(rec, None)
+
+    st.sidebar.file_uploader = uploader
+    import app
+    app.main()
+
+
+def _start():
+    at = AppTest.from_function(_run_app, args=(make_history(),), default_timeout=60).run()
+    assert not at.exception
+    return at
+
+
+def _video_selector(at):
+    return next(s for s in at.sidebar.selectbox if s.label.startswith('表示したい動画'))
+
+
+def _subheaders(at):
+    return [s.value for s in at.subheader]
+
+
+def test_overall_view_is_default():
+    at = _start()
+    assert '📈 全体の視聴統計' in _subheaders(at)
+    assert not at.sidebar.text_input  # ID 入力欄は「動画IDで指定」を選んだときだけ出る
+
+
+def test_video_id_input_shows_that_video():
+    at = _start()
+    _video_selector(at).set_value(OTHER_LABEL).run()
+    at.sidebar.text_input[0].set_value('vid00000000').run()
+    assert not at.exception
+    assert '🎥 Video 0' in _subheaders(at)
+
+
+def test_selectbox_still_works_after_entering_an_id():
+    at = _start()
+    _video_selector(at).set_value(OTHER_LABEL).run()
+    at.sidebar.text_input[0].set_value('vid00000000').run()
+
+    # 入力済みの ID があっても、一覧から選んだ動画が表示される
+    _video_selector(at).set_value('Video 4').run()
+    assert not at.exception
+    assert '🎥 Video 4' in _subheaders(at)
+    assert '🎥 Video 0' not in _subheaders(at)
+
+    # 全体統計にも戻れる
+    _video_selector(at).set_value(OVERALL_LABEL).run()
+    assert '📈 全体の視聴統計' in _subheaders(at)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# dashboard.core のデータ処理のテスト
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_history
+from dashboard import core
+
+
+def _regex_video_id(urls):
+    """_extract_video_id が再現すべき従来の抽出結果。"""
+    return pd.Series(urls, dtype='string[pyarrow]').str.extract(r'v=([^&]+)', expand=False)
+
+
+@pytest.mark.parametrize('url', [
+    # 固定位置のスライスで取れる URL
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://music.youtube.com/watch?v=ab_cd-EF123',
+    'https://www.youtube.com/watch?app=desktop&v=dQw4w9WgXcQ',
+])
+def test_extract_video_id_fast_path(url):
+    result = core._extract_video_id(pd.Series([url]))
+    assert result.iloc[0] == _regex_video_id([url]).iloc[0]
+    assert result.iloc[0] == url[-11:]
+
+
+@pytest.mark.parametrize('url', [
+    # 正規表現に回す URL（末尾 11 文字が ID とは限らないもの）
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1s',
+    'https://www.youtube.com/watch?v=abc&t=12345',
+    'https://www.youtube.com/watch?v=first#v=dQw4w9WgXcQ',
+    'https://www.youtube.com/watch?v=abcdefghijk#frag5678901',
+    'https://www.youtube.com/watch?xv=dQw4w9WgXcQ',
+    'https://www.youtube.com/watch?v=dQw4w9W.gXc',
+    'https://www.youtube.com/post/xyz',
+])
+def test_extract_video_id_matches_regex_fallback(url):
+    result = core._extract_video_id(pd.Series([url]))
+    pd.testing.assert_series_equal(result, _regex_video_id([url]), check_names=False)
+
+
+def test_extract_video_id_mixed_column():
+    urls = [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        None,
+        'https://www.youtube.com/watch?v=first#v=dQw4w9WgXcQ',
+        'https://www.youtube.com/post/xyz',
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1s',
+    ]
+    result = core._extract_video_id(pd.Series(urls, dtype=object))
+    pd.testing.assert_series_equal(result, _regex_video_id(urls), check_names=False)
+
+def _pivot_table_weekday(df, date_col, value_col):
+    """変更前の _weekday_pivot と同じ pivot_table(fill_value=0) による表。"""
+    tmp = df.copy()
+    dt = pd.to_datetime(tmp[date_col])
+    tmp['day'] = dt.dt.day
+    tmp['month_year'] = dt.dt.to_period('M').astype(str)
+    tmp['weekday'] = dt.dt.dayofweek.map(dict(enumerate(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])))
+    pt = pd.pivot_table(tmp, values=value_col, index='weekday', columns=['month_year', 'day'], fill_value=0)
+    return pt.reindex(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+
+def test_weekday_pivot_matches_pivot_table():
+    dates = pd.to_datetime(['2023-12-30', '2024-01-01', '2024-01-02', '2024-01-31', '2024-03-15'])
+    df = pd.DataFrame({'date': dates, 'views': [3, 1, 4, 1, 5]})
+    got = core.weekday_pivot(df, 'date', 'views')
+    expected = _pivot_table_weekday(df, 'date', 'views')
+    # 2024-01-02 は火曜。データのある月曜の行は 0、一度も現れない日曜の行は NaN
+    assert got.loc['Mon', ('2024-01', 2)] == 0
+    assert got.loc['Sun'].isna().all()
+    pd.testing.assert_frame_equal(got, expected, check_names=False, check_dtype=False, check_column_type=False, check_index_type=False)
+
+def test_polars_and_pandas_loaders_return_same_dtypes():
+    pytest.importorskip('polars')
+    by_pandas = core._load_with_pandas(io.BytesIO(make_history()))
+    by_polars = core._load_with_polars(io.BytesIO(make_history()))
+    assert by_polars.dtypes.to_dict() == by_pandas.dtypes.to_dict()
+
+    # ディスクキャッシュ（Parquet）を書いて読み戻しても同じ型・同じ中身で返る
+    key = core._file_digest(io.BytesIO(make_history()))
+    core._write_disk_cache(key, by_pandas, {'vid00000000': {'title': 'Video 0', 'thumbnail_url': '', 'channel_name': 'Chan0'}})
+    from_disk, _ = core._read_disk_cache(key)
+    assert from_disk.dtypes.to_dict() == by_pandas.dtypes.to_dict()
+    assert from_disk.equals(by_pandas)
+    assert by_pandas['title'].dtype == 'string[pyarrow]'
+    assert by_pandas['channel_name'].dtype == 'string[pyarrow]'
+
+def _sample_processed(n_rows=2000, n_videos=40, seed=0):
+    """月をまたぐ期間に、同じ日に同じ動画を複数回見た行や日時の欠損も含む df_processed。"""
+    rng = np.random.default_rng(seed)
+    times = (pd.Timestamp('2023-11-20', tz='UTC')
+             + pd.to_timedelta(rng.integers(0, 90 * 24 * 3600, n_rows), unit='s'))
+    times = pd.Series(times).dt.tz_convert('Asia/Tokyo')
+    times.iloc[::250] = pd.NaT
+    ids = [f'v{i:010d}' for i in rng.integers(0, n_videos, n_rows)]
+    return pd.DataFrame({'video_id': pd.Series(ids).astype('category'), 'time_jst': times})
+
+def _groupby_aggregates(df_processed):
+    """変更前の groupby / value_counts による集計（build_aggregates が再現すべき結果）。"""
+    df_daily = (
+        df_processed
+        .groupby([df_processed['time_jst'].dt.date, 'video_id'], observed=True)
+        .size()
+        .reset_index(name='daily_watch_count')
+    )
+    df_daily.columns = ['time_jst', 'video_id', 'daily_watch_count']
+    df_daily['time'] = pd.to_datetime(df_daily['time_jst'])
+    df_cumulative = df_daily.sort_values(['video_id', 'time'])
+    df_cumulative['cumulative_watch_count'] = df_cumulative.groupby('video_id', observed=True)['daily_watch_count'].cumsum()
+
+    df_daily_total = df_processed['time_jst'].dt.normalize().dt.tz_localize(None).value_counts().sort_index().reset_index()
+    df_daily_total.columns = ['date', 'total_watch_count']
+    df_monthly_total = df_processed['time_jst'].dt.tz_localize(None).dt.to_period('M').value_counts().sort_index().reset_index()
+    df_monthly_total.columns = ['month', 'total_watch_count']
+    df_monthly_total['month'] = df_monthly_total['month'].astype(str)
+    return df_cumulative, df_daily_total, df_monthly_total
+
+@pytest.mark.parametrize('use_numba', [True, False])
+def test_build_aggregates_matches_groupby(use_numba, monkeypatch):
+    if not use_numba:
+        monkeypatch.setattr(core, '_segment_cumsum_numba', None)  # numpy の累積和に切り替える
+    df_processed = _sample_processed()
+    df_cumulative, df_daily_total, df_monthly_total, video_slice = core.build_aggregates(df_processed)
+    ref_cumulative, ref_daily_total, ref_monthly_total = _groupby_aggregates(df_processed)
+
+    cols = ['time', 'video_id', 'daily_watch_count', 'cumulative_watch_count']
+    pd.testing.assert_frame_equal(
+        df_cumulative[cols].reset_index(drop=True).astype({'video_id': str}),
+        ref_cumulative[cols].reset_index(drop=True).astype({'video_id': str}),
+        check_dtype=False,
+    )
+    pd.testing.assert_frame_equal(df_daily_total, ref_daily_total, check_dtype=False)
+    pd.testing.assert_frame_equal(df_monthly_total, ref_monthly_total, check_dtype=False)
+
+    # video_slice の範囲はその動画の行だけを指す
+    for vid, (start, end) in video_slice.items():
+        assert (df_cumulative['video_id'].iloc[start:end] == vid).all()
+        assert end - start == (ref_cumulative['video_id'] == vid).sum()